@@ -9,6 +9,9 @@
 // ArduinoJson used for Pi <-> ESP structured communication
 #include <ArduinoJson.h>
 
+// mbedTLS ships with the ESP32 core; used to decode base64 RAW payloads
+#include <mbedtls/base64.h>
+
 /*
   Pins are injected from platformio.ini:
    - IR_SEND_PIN  -> MOSFET gate driving IR LEDs
@@ -27,6 +30,20 @@
 #define SERIAL_BAUD 115200
 #endif
 
+// Highest rate the Pi may switch the link to with the "baud" command
+#ifndef SERIAL_MAX_BAUD
+#define SERIAL_MAX_BAUD 921600
+#endif
+
+/*
+ The Pi batches several commands into one write, and the loop does not
+ drain Serial while an IR frame is being transmitted — size the RX buffer
+ so a full batch (including define_raw payloads) fits without overrun.
+*/
+#ifndef SERIAL_RX_BUFFER
+#define SERIAL_RX_BUFFER 4096
+#endif
+
 // ---------------- IR Configuration ----------------
 
 // Raw capture buffer (enough for most remotes)
@@ -161,9 +178,34 @@ bool upsertCode(const StoredCode &c) {
 decode_type_t typeFromString(const char *s) { return strToDecodeType(s); }
 
 /*
- Send JSON reply over Serial
+ Request id of the command being handled. When the Pi tags a command with
+ an integer "id", every reply to it echoes that id so pipelined responses
+ can be correlated.
 */
-void sendJson(const JsonDocument &doc) {
+bool hasReplyId = false;
+int32_t replyId = 0;
+
+/*
+ Link framing. The firmware boots speaking newline-delimited JSON; the
+ "framing" command switches both directions to length-prefixed
+ MessagePack (4-byte little-endian length, then the packed document).
+*/
+bool packedFraming = false;
+
+/*
+ Send a reply over Serial in the current framing
+*/
+void sendJson(JsonDocument &doc) {
+  if (hasReplyId)
+    doc["id"] = replyId;
+  if (packedFraming) {
+    uint32_t n = measureMsgPack(doc);
+    uint8_t hdr[4] = {(uint8_t)n, (uint8_t)(n >> 8), (uint8_t)(n >> 16),
+                      (uint8_t)(n >> 24)};
+    Serial.write(hdr, sizeof(hdr));
+    serializeMsgPack(doc, Serial);
+    return;
+  }
   serializeJson(doc, Serial);
   Serial.println();
 }
@@ -313,6 +355,17 @@ void handleList() {
     JsonObject o = arr.add<JsonObject>();
     o["name"] = codes[i].name;
     o["type"] = codes[i].isRaw ? "RAW" : typeToString(codes[i].protocol);
+
+    // Enough detail for the Pi to tell whether a stored code is up to date
+    if (codes[i].isRaw) {
+      o["freq"] = codes[i].freq;
+      o["len"] = codes[i].rawlen;
+    } else {
+      char buf[24];
+      snprintf(buf, sizeof(buf), "0x%llX", (unsigned long long)codes[i].value);
+      o["value"] = buf;
+      o["bits"] = codes[i].bits;
+    }
   }
 
   sendJson(doc);
@@ -338,89 +391,135 @@ void handleErase(const String &name) {
   replyOk("erased");
 }
 
+/*
+ Optional commands this firmware understands, advertised in the ping reply
+ so the Pi can use them without breaking older firmware.
+*/
+static const char *const kCaps[] = {"define_and_send", "define_raw_b64", "baud", "msgpack"};
+
 void handlePing() {
   JsonDocument doc;
   doc["ok"] = true;
   doc["msg"] = "pong";
+
+  JsonArray caps = doc["caps"].to<JsonArray>();
+  for (const char *cap : kCaps)
+    caps.add(cap);
+
   sendJson(doc);
 }
 
 /*
- define — load a decoded IR code from the Pi into RAM
- Input:
-   {"cmd":"define","name":"tv1_power","type":"NEC","value":"0x20DF10EF","bits":32}
+ Parse the fields of a decoded-protocol define into sc.
+ Returns nullptr on success, or the error string to reply with.
 */
-void handleDefine(const JsonDocument &cmd) {
+const char *parseDefine(const JsonDocument &cmd, StoredCode &sc) {
   const char *name = cmd["name"] | "";
   const char *typeStr = cmd["type"] | "";
   const char *valueStr = cmd["value"] | "";
   uint16_t bits = cmd["bits"] | 32;
 
   if (!name[0])
-    return replyErr("missing_name");
+    return "missing_name";
   if (!typeStr[0])
-    return replyErr("missing_type");
+    return "missing_type";
   if (!valueStr[0])
-    return replyErr("missing_value");
+    return "missing_value";
 
   decode_type_t proto = typeFromString(typeStr);
   if (proto == UNKNOWN)
-    return replyErr("unknown_type");
+    return "unknown_type";
 
-  // Parse hex string value (accepts "0x..." or plain decimal)
-  uint64_t value = (uint64_t)strtoull(valueStr, nullptr, 0);
-
-  StoredCode sc;
   sc.name = name;
   sc.isRaw = false;
   sc.protocol = proto;
-  sc.value = value;
+  // Parse hex string value (accepts "0x..." or plain decimal)
+  sc.value = (uint64_t)strtoull(valueStr, nullptr, 0);
   sc.bits = bits;
-
-  if (!upsertCode(sc))
-    return replyErr("storage_full");
-
-  replyOk("defined");
+  return nullptr;
 }
 
 /*
- define_raw — load a RAW IR code from the Pi into RAM
- Input:
-   {"cmd":"define_raw","name":"tv2_power","freq":38000,"data":[9024,4512,...]}
+ Parse the fields of a RAW define into sc.  "data" is either a JSON array
+ of µs timings or a base64 string of little-endian uint16 timings (the
+ compact form sent by define_raw_b64).
+ sc.rawbuf points at a static temp buffer — upsertCode() deep-copies it,
+ so sc never owns heap memory.
+ Returns nullptr on success, or the error string to reply with.
 */
-void handleDefineRaw(const JsonDocument &cmd) {
+const char *parseDefineRaw(const JsonDocument &cmd, StoredCode &sc) {
   const char *name = cmd["name"] | "";
   uint32_t freq = cmd["freq"] | kDefaultFreq;
 
   if (!name[0])
-    return replyErr("missing_name");
-
-  JsonArrayConst arr = cmd["data"];
-  if (arr.isNull())
-    return replyErr("missing_data");
-
-  uint16_t len = arr.size();
-  if (len == 0)
-    return replyErr("empty_data");
-  if (len > kMaxRawLen)
-    return replyErr("raw_too_long");
+    return "missing_name";
 
   // Static temp buffer — 1 KB, kept off the task stack.
-  // upsertCode() deep-copies from here into the stored slot's own heap block.
   static uint16_t tmp[kMaxRawLen];
-  for (uint16_t i = 0; i < len; i++) {
-    uint32_t v = arr[i] | 0;
-    tmp[i] = (uint16_t)(v > 0xFFFF ? 0xFFFF : v);
+  uint16_t len = 0;
+
+  JsonVariantConst data = cmd["data"];
+  if (data.is<const char *>()) {
+    const char *b64 = data;
+    size_t olen = 0;
+    int rc = mbedtls_base64_decode((unsigned char *)tmp, sizeof(tmp), &olen,
+                                   (const unsigned char *)b64, strlen(b64));
+    if (rc == MBEDTLS_ERR_BASE64_BUFFER_TOO_SMALL)
+      return "raw_too_long";
+    if (rc != 0 || olen % 2)
+      return "bad_base64";
+    len = olen / 2; // ESP32 is little-endian, matching the Pi's packing
+  } else {
+    JsonArrayConst arr = data;
+    if (arr.isNull())
+      return "missing_data";
+
+    if (arr.size() > kMaxRawLen)
+      return "raw_too_long";
+    len = arr.size();
+    for (uint16_t i = 0; i < len; i++) {
+      uint32_t v = arr[i] | 0;
+      tmp[i] = (uint16_t)(v > 0xFFFF ? 0xFFFF : v);
+    }
   }
 
-  // Build a lightweight descriptor pointing at tmp.
-  // upsertCode() will malloc its own copy — this sc never owns heap memory.
-  StoredCode sc;
+  if (len == 0)
+    return "empty_data";
+
   sc.name = name;
   sc.isRaw = true;
   sc.freq = freq;
   sc.rawbuf = tmp;
   sc.rawlen = len;
+  return nullptr;
+}
+
+/*
+ define — load a decoded IR code from the Pi into RAM
+ Input:
+   {"cmd":"define","name":"tv1_power","type":"NEC","value":"0x20DF10EF","bits":32}
+*/
+void handleDefine(const JsonDocument &cmd) {
+  StoredCode sc;
+  if (const char *err = parseDefine(cmd, sc))
+    return replyErr(err);
+
+  if (!upsertCode(sc))
+    return replyErr("storage_full");
+
+  replyOk("defined");
+}
+
+/*
+ define_raw / define_raw_b64 — load a RAW IR code from the Pi into RAM
+ Input:
+   {"cmd":"define_raw","name":"tv2_power","freq":38000,"data":[9024,4512,...]}
+   {"cmd":"define_raw_b64","name":"tv2_power","freq":38000,"data":"QCPAEf..."}
+*/
+void handleDefineRaw(const JsonDocument &cmd) {
+  StoredCode sc;
+  if (const char *err = parseDefineRaw(cmd, sc))
+    return replyErr(err);
 
   if (!upsertCode(sc))
     return replyErr("storage_full");
@@ -428,10 +527,80 @@ void handleDefineRaw(const JsonDocument &cmd) {
   replyOk("defined");
 }
 
+/*
+ define_and_send — define (or overwrite) a code and transmit it at once,
+ saving the Pi a round-trip per code at boot.
+ Input: the fields of define, or of define_raw with "type":"RAW", plus
+ an optional "repeats":
+   {"cmd":"define_and_send","name":"tv1_power","type":"NEC","value":"0x20DF10EF","bits":32,"repeats":0}
+*/
+void handleDefineAndSend(const JsonDocument &cmd) {
+  const char *typeStr = cmd["type"] | "";
+
+  StoredCode sc;
+  const char *err = strcasecmp(typeStr, "RAW") == 0 ? parseDefineRaw(cmd, sc)
+                                                    : parseDefine(cmd, sc);
+  if (err)
+    return replyErr(err);
+
+  if (!upsertCode(sc))
+    return replyErr("storage_full");
+
+  if (!sendStored(codes[findCodeIndex(sc.name)], cmd["repeats"] | 1))
+    return replyErr("send_failed");
+
+  replyOk("sent");
+}
+
 // ---------------- Arduino lifecycle ----------------
 
+/*
+ baud — switch the link rate after replying at the current one
+ Input:
+   {"cmd":"baud","rate":921600}
+ The Pi must confirm with any valid command within kBaudConfirmMs, or the
+ firmware drops back to SERIAL_BAUD so a failed switch cannot strand the link.
+*/
+static const uint32_t kBaudConfirmMs = 1000;
+uint32_t baudSwitchedAt = 0; // 0 = current rate confirmed
+
+void handleBaud(const JsonDocument &cmd) {
+  uint32_t rate = cmd["rate"] | 0;
+
+  if (rate < 9600 || rate > SERIAL_MAX_BAUD)
+    return replyErr("bad_rate");
+
+  replyOk("baud");
+  Serial.flush(); // let the reply leave at the old rate
+  Serial.updateBaudRate(rate);
+  baudSwitchedAt = rate == SERIAL_BAUD ? 0 : (millis() | 1);
+}
+
+/*
+ framing — switch the link between JSON lines and MessagePack frames
+ Input:
+   {"cmd":"framing","mode":"msgpack"}   (or "json" to switch back)
+ The reply ({"ok":true,"msg":"msgpack"}) still uses the old framing, so
+ the Pi knows exactly where the switch happens. A reset returns to JSON.
+*/
+void handleFraming(const JsonDocument &cmd) {
+  const char *mode = cmd["mode"] | "";
+  bool packed;
+
+  if (!strcmp(mode, "msgpack"))
+    packed = true;
+  else if (!strcmp(mode, "json"))
+    packed = false;
+  else
+    return replyErr("bad_mode");
+
+  replyOk(mode);
+  packedFraming = packed;
+}
+
 void setup() {
 
+  Serial.setRxBufferSize(SERIAL_RX_BUFFER); // must precede begin()
   Serial.begin(SERIAL_BAUD);
   delay(200);
 
@@ -443,85 +612,149 @@ void setup() {
 }
 
 /*
- Main loop:
-
- 1) Read JSON line from Serial
- 2) Parse
- 3) Execute command
+ Execute one parsed command
 */
-String line;
+void handleCommand(JsonDocument &cmd) {
+  const char *command = cmd["cmd"] | "";
 
-void loop() {
+  if (!strcmp(command, "ping"))
+    handlePing();
 
-  while (Serial.available()) {
+  else if (!strcmp(command, "list"))
+    handleList();
 
-    char c = Serial.read();
+  else if (!strcmp(command, "erase"))
+    handleErase(cmd["name"] | "");
 
-    if (c == '\n') {
+  else if (!strcmp(command, "learn")) {
 
-      JsonDocument cmd;
-      if (deserializeJson(cmd, line)) {
-        line = "";
-        return replyErr("json_parse");
-      }
+    StoredCode sc;
+    sc.name = cmd["name"] | "";
 
-      line = "";
+    // Reject empty name before committing to listen
+    if (sc.name.length() == 0)
+      return replyErr("missing_name");
 
-      const char *command = cmd["cmd"] | "";
+    replyOk("learn_ready");
 
-      if (!strcmp(command, "ping"))
-        handlePing();
+    if (!learnOnce(sc, cmd["timeout_ms"] | 15000))
+      return replyErr("learn_timeout");
 
-      else if (!strcmp(command, "list"))
-        handleList();
+    upsertCode(sc);          // deep-copies RAW buffer into codes[]
+    emitLearnedResponse(sc); // sc.rawbuf points to static tmp — not heap
+  }
 
-      else if (!strcmp(command, "erase"))
-        handleErase(cmd["name"] | "");
+  else if (!strcmp(command, "send")) {
 
-      else if (!strcmp(command, "learn")) {
+    String name = cmd["name"] | "";
+    int idx = findCodeIndex(name);
 
-        StoredCode sc;
-        sc.name = cmd["name"] | "";
+    if (idx < 0)
+      return replyErr("not_found");
 
-        // Reject empty name before committing to listen
-        if (sc.name.length() == 0)
-          return replyErr("missing_name");
+    if (!sendStored(codes[idx], cmd["repeats"] | 1))
+      return replyErr("send_failed");
 
-        replyOk("learn_ready");
+    replyOk("sent");
+  }
 
-        if (!learnOnce(sc, cmd["timeout_ms"] | 15000))
-          return replyErr("learn_timeout");
+  else if (!strcmp(command, "define"))
+    handleDefine(cmd);
 
-        upsertCode(sc);          // deep-copies RAW buffer into codes[]
-        emitLearnedResponse(sc); // sc.rawbuf points to static tmp — not heap
-      }
+  else if (!strcmp(command, "define_raw") || !strcmp(command, "define_raw_b64"))
+    handleDefineRaw(cmd);
 
-      else if (!strcmp(command, "send")) {
+  else if (!strcmp(command, "define_and_send"))
+    handleDefineAndSend(cmd);
 
-        String name = cmd["name"] | "";
-        int idx = findCodeIndex(name);
+  else if (!strcmp(command, "baud"))
+    handleBaud(cmd);
 
-        if (idx < 0)
-          return replyErr("not_found");
+  else if (!strcmp(command, "framing"))
+    handleFraming(cmd);
 
-        if (!sendStored(codes[idx], cmd["repeats"] | 1))
-          return replyErr("send_failed");
+  else
+    replyErr("unknown_cmd");
+}
 
-        replyOk("sent");
-      }
+/*
+ Main loop:
+
+ 1) Read a frame from Serial — a JSON line, or a length-prefixed
+    MessagePack frame once the Pi has switched framing
+ 2) Parse
+ 3) Execute command
+*/
+String line;
+static uint8_t frameBuf[SERIAL_RX_BUFFER];
+size_t frameHave = 0;
+
+void loop() {
+
+  if (baudSwitchedAt && millis() - baudSwitchedAt > kBaudConfirmMs) {
+    Serial.updateBaudRate(SERIAL_BAUD);
+    baudSwitchedAt = 0;
+    line = "";
+    frameHave = 0;
+  }
 
-      else if (!strcmp(command, "define"))
-        handleDefine(cmd);
+  while (Serial.available()) {
 
-      else if (!strcmp(command, "define_raw"))
-        handleDefineRaw(cmd);
+    uint8_t c = Serial.read();
+    JsonDocument cmd;
+    DeserializationError err;
 
-      else
-        replyErr("unknown_cmd");
+    if (packedFraming) {
+      // 4-byte little-endian length, then that many bytes of MessagePack
+      frameBuf[frameHave++] = c;
+      if (frameHave < 4)
+        continue;
+      uint32_t len = frameBuf[0] | frameBuf[1] << 8 | frameBuf[2] << 16 |
+                     (uint32_t)frameBuf[3] << 24;
+      if (len > sizeof(frameBuf) - 4) {
+        // The Pi never sends a frame this long, so the stream is out of step
+        // (the Pi side started over, or bytes were lost) and `len` is not to
+        // be trusted — drop the partial frame and fall back to JSON
+        frameHave = 0;
+        packedFraming = false;
+        line = "";
+        if (frameBuf[0] == '{') {
+          // A JSON line (e.g. a new program opened the port without
+          // resetting us): keep its first bytes
+          for (size_t i = 0; i < 4; i++)
+            line += (char)frameBuf[i];
+          continue;
+        }
+        hasReplyId = false;
+        replyErr("frame_too_long"); // as JSON, so the Pi follows
+        continue;
+      }
+      if (frameHave < 4 + len)
+        continue;
+      frameHave = 0;
+      err = deserializeMsgPack(cmd, frameBuf + 4, len);
+    } else {
+      if (c == '\r')
+        continue;
+      if (c != '\n') {
+        line += (char)c;
+        continue;
+      }
+      err = deserializeJson(cmd, line);
+      line = "";
+    }
 
+    if (err) {
+      hasReplyId = false;
+      replyErr(packedFraming ? "msgpack_parse" : "json_parse");
+      continue;
     }
 
-    else if (c != '\r')
-      line += c;
+    baudSwitchedAt = 0; // a command parsed, so the current rate works
+
+    hasReplyId = cmd["id"].is<int32_t>();
+    replyId = cmd["id"] | 0;
+
+    handleCommand(cmd);
   }
-}
\ No newline at end of file
+}
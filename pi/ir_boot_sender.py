@@ -5,12 +5,20 @@ ir_boot_sender.py — Boot-time IR code sender for TVWIZ IR Controller
 Designed to run as a systemd oneshot service at Raspberry Pi startup.
 
 Flow:
-  1. Load boot_config.json (written by ir_recorder.py)
-  2. Open serial to ESP32, retry until device appears
-  3. Ping ESP32
+  1. Load boot_config.json (written by ir_recorder.py), or the pre-encoded
+     boot_config.frames cache next to it when it was built from that file
+  2. Meanwhile, in a worker thread: wait for the ESP32's device node; once
+     there are codes to send, open serial to it (retrying until it
+     appears) and ping it
+  3. Switch to --fast-baud if the firmware supports it (the firmware is
+     put back on --baud before the port is closed)
   4. For each code with "send_on_boot": true:
        a. Push it into ESP32 RAM with define / define_raw
        b. Send it
+     (a single define_and_send when the firmware advertises it in its pong;
+     decoded codes the ESP32 already holds, per `list`, are only sent)
+     Commands are written from a worker thread while responses are drained,
+     so consecutive codes without a delay_before_ms are pipelined.
   5. Exit 0 on success, 1 if any send failed
 
 boot_config.json is self-contained: it carries all signal data so no
@@ -18,6 +26,7 @@ remote control is needed at boot time.
 
 Usage (manual test):
     python3 ir_boot_sender.py [--port /dev/ttyUSB0] [--config boot_config.json]
+                              [--baud 115200] [--fast-baud 921600]
 
 See README.md for systemd installation instructions.
 """
@@ -26,91 +35,519 @@ import serial
 import json
 import time
 import argparse
+import base64
 import os
 import sys
 import logging
+import pickle
+import queue
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from typing import Iterable, Optional
+
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:  # orjson is optional — ujson, then stdlib, with the same bytes API
+    try:
+        import ujson
+
+        def json_dumps(obj) -> bytes:
+            return ujson.dumps(obj, escape_forward_slashes=False).encode()
+        json_loads = ujson.loads
+    except ImportError:
+        def json_dumps(obj) -> bytes:
+            return json.dumps(obj, separators=(",", ":")).encode()
+        json_loads = json.loads
+
+try:
+    import ijson  # optional: streams large boot configs entry by entry
+except ImportError:
+    ijson = None
+
+# main is the entry point; the rest is shared with ir_recorder.py, which
+# writes the frames cache through build_plan / write_boot_frames so the
+# layout has one definition
+__all__ = ["main", "build_plan", "write_boot_frames", "json_dumps", "json_loads",
+           "set_low_latency", "BASE_BAUD", "FAST_BAUD", "BAUD_CONFIRM", "WRITE_TIMEOUT"]
 
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
-BOOT_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "boot_config.json")
+_HERE = os.path.dirname(os.path.abspath(__file__))
+BOOT_CONFIG_FILE = os.path.join(_HERE, "boot_config.json")
+FRAMES_VERSION = 7   # bump when the boot_config.frames layout changes
+STREAM_THRESHOLD = 16 * 1024   # bytes; larger configs are streamed with ijson
 DEFAULT_PORT = "/dev/ttyUSB0"
-DEFAULT_BAUD = 115200
+BASE_BAUD = 115200      # default --baud: the rate the firmware boots at (SERIAL_BAUD)
+FAST_BAUD = 921600      # default --fast-baud, switched to after the ping when allowed
+BAUD_CONFIRM = 1.0      # seconds the firmware waits before undoing a baud switch
+WRITE_TIMEOUT = 2       # seconds; a stuck TX fails the write instead of hanging
 MAX_RETRIES = 5
 RETRY_DELAY = 2   # seconds between retries
+BOOT_TIMEOUT = 3.0    # seconds to wait for the ESP32 to report it is up
+POLL_INTERVAL = 0.1   # seconds; granularity of the readiness / device polls
+RX_WINDOW = 4096      # bytes in flight to firmware with caps; matches SERIAL_RX_BUFFER
+LEGACY_RX_WINDOW = 256   # older firmware keeps the Arduino core's default RX buffer
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[logging.StreamHandler(sys.stdout)],
-)
 log = logging.getLogger("ir_boot_sender")
 
+# Static commands, encoded once
+PING_FRAME = json_dumps({"cmd": "ping"}) + b"\n"
+LIST_FRAME = json_dumps({"cmd": "list"}) + b"\n"
+
 
 # ---------------------------------------------------------------------------
 # Serial helpers
 # ---------------------------------------------------------------------------
 
-def open_serial(port: str, baud: int) -> serial.Serial:
+def wait_for_device(port: str, timeout: float) -> None:
+    """
+    Wait up to `timeout` seconds for the port's device node to appear, so a
+    slow USB enumeration is picked up as soon as it happens.
+    """
+    if os.path.exists(port):  # present but failed to open — just back off
+        time.sleep(timeout)
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not os.path.exists(port):
+        time.sleep(POLL_INTERVAL)
+
+
+class FramedSerial(serial.Serial):
+    """
+    serial.Serial that reads in bulk — whatever is waiting, in one read() —
+    and splits replies on newlines itself, instead of readline()'s
+    byte-at-a-time reads.  Bytes past the first newline stay buffered for
+    the next call, so several pipelined replies cost a single syscall.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._rx = bytearray()
+        self.base_baud: Optional[int] = None
+        super().__init__(*args, **kwargs)
+        self.base_baud = self.baudrate  # what the firmware is told to return to on close
+
+    def recv_line(self) -> bytes:
+        """
+        Return the next line including its newline, or the partial line
+        (possibly b"") once `timeout` has passed — like readline(), the
+        timeout bounds the whole line, not just the gap between chunks.
+        """
+        saved = self.timeout
+        timeout = serial.Timeout(saved)
+        try:
+            while True:
+                nl = self._rx.find(b"\n")
+                if nl >= 0:
+                    line = bytes(self._rx[:nl + 1])
+                    del self._rx[:nl + 1]
+                    return line
+                if timeout.expired():
+                    break
+                waiting = self.in_waiting
+                if not waiting:
+                    # Block for what is left of the line's budget, not a full timeout
+                    self.timeout = timeout.time_left()
+                chunk = self.read(max(1, waiting))
+                if not chunk:
+                    break
+                self._rx += chunk
+        finally:
+            if self.timeout != saved:
+                self.timeout = saved
+        line = bytes(self._rx)
+        self._rx.clear()
+        return line
+
+    def recv_json(self) -> dict:
+        raw = self.recv_line()
+        if not raw:
+            return {"ok": False, "err": "no_response"}
+        try:
+            return json_loads(raw)
+        except ValueError as exc:
+            return {"ok": False, "err": f"json_parse: {exc}"}
+
+    def reset_input_buffer(self) -> None:
+        self._rx.clear()
+        super().reset_input_buffer()
+
+    def close(self) -> None:
+        # Hand the link back at the rate it was opened at, so the next program
+        # to open the port (the firmware stays switched until it is reset)
+        # still finds it there
+        if self.is_open and self.base_baud and self.baudrate != self.base_baud:
+            with suppress(serial.SerialException):
+                if send_cmd(self, {"cmd": "baud", "rate": self.base_baud}).get("ok"):
+                    self.baudrate = self.base_baud
+        super().close()
+
+
+def set_low_latency(ser: FramedSerial) -> None:
+    """
+    Drop the USB-serial latency timer to 1 ms (16 ms by default on FTDI-style
+    bridges) so short replies are not held back in the adapter.  Linux
+    only, best effort: a missing sysfs node or ioctl just logs a warning.
+    """
+    if not sys.platform.startswith("linux"):
+        return
+    tty = os.path.basename(os.path.realpath(ser.port))  # resolves /dev/serial/by-id links
+    # usb-serial bridges (ttyUSB*) list it under the bus; other drivers
+    # that have one expose it through the tty's device node
+    for node in (f"/sys/bus/usb-serial/devices/{tty}/latency_timer",
+                 f"/sys/class/tty/{tty}/device/latency_timer"):
+        if not os.path.exists(node):
+            continue
+        try:
+            with open(node, "w") as f:
+                f.write("1")
+            return
+        except PermissionError as exc:
+            log.warning(f"Cannot write {node}: {exc} "
+                        "(needs root or a udev rule — see README)")
+        except OSError as exc:
+            log.warning(f"Cannot write {node}: {exc}")
+        break
+    try:
+        ser.set_low_latency_mode(True)  # TIOCSSERIAL / ASYNC_LOW_LATENCY
+    except (AttributeError, OSError, ValueError) as exc:
+        log.warning(f"Low-latency mode not available on {tty}: {exc}")
+
+
+def wait_ready(ser: FramedSerial) -> bool:
+    """
+    Wait for the ESP32 firmware to come up instead of sleeping a fixed time.
+
+    Opening the port may reset the ESP32 (it depends on the board's
+    DTR/RTS auto-reset wiring), which then prints its {"msg": "boot"}
+    banner once setup() is done.  If the board was not reset there is no
+    banner, so a ping is sent whenever the line goes quiet and the first
+    pong counts as ready.  Replies to any extra pings are drained so the
+    next command starts from a clean input buffer.
+    """
+    saved = ser.timeout
+    ser.timeout = POLL_INTERVAL
+    try:
+        ready = False
+        deadline = time.monotonic() + BOOT_TIMEOUT
+        while not ready and time.monotonic() < deadline:
+            raw = ser.recv_line()
+            if not raw:
+                ser.write(PING_FRAME)
+                continue
+            try:
+                resp = json_loads(raw)
+            except ValueError:
+                continue  # ROM bootloader chatter
+            ready = isinstance(resp, dict) and resp.get("msg") in ("boot", "pong")
+        while ser.recv_line():
+            pass
+        ser.reset_input_buffer()
+        return ready
+    finally:
+        ser.timeout = saved
+
+
+def try_open(port: str, baud: int) -> FramedSerial:
+    """
+    Bare open.  exclusive=True makes a port held by another process (e.g. a
+    running ir_recorder.py) fail immediately instead of sharing the line.
+    """
+    return FramedSerial(port, baud, timeout=5, write_timeout=WRITE_TIMEOUT,
+                        exclusive=True)
+
+
+def prepare(ser: FramedSerial, fast_baud: int) -> None:
+    """
+    One-time setup of a freshly opened port, before the first command.  A
+    board that was not reset by the open may still be at `fast_baud`, left
+    there by a run that never got to restore it; it is looked for there too.
+    """
+    set_low_latency(ser)
+    if wait_ready(ser):
+        return
+    if fast_baud and fast_baud != ser.baudrate:
+        ser.baudrate = fast_baud
+        if wait_ready(ser):
+            log.info(f"ESP32 answered at {fast_baud} baud — it was not reset since the last run.")
+            return
+        ser.baudrate = ser.base_baud
+    log.warning(f"No boot banner or pong within {BOOT_TIMEOUT} s — continuing.")
+
+
+def open_serial(port: str, baud: int, fast_baud: int) -> FramedSerial:
     """Open serial, retrying until the device appears (ESP32 may be slow to enumerate)."""
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            ser = serial.Serial(port, baud, timeout=5)
-            time.sleep(1.5)           # let ESP32 finish boot
-            ser.reset_input_buffer()  # discard boot message
-            return ser
+            ser = try_open(port, baud)
         except serial.SerialException as exc:
             log.warning(f"Attempt {attempt}/{MAX_RETRIES}: {exc}")
-            time.sleep(RETRY_DELAY)
+            wait_for_device(port, RETRY_DELAY)
+            continue
+        prepare(ser, fast_baud)
+        return ser
     log.error(f"Could not open {port} after {MAX_RETRIES} attempts.")
     sys.exit(1)
 
 
-def send_cmd(ser: serial.Serial, cmd: dict) -> dict:
-    ser.write((json.dumps(cmd) + "\n").encode())
-    raw = ser.readline()
-    if not raw:
-        return {"ok": False, "err": "no_response"}
-    try:
-        return json.loads(raw.decode().strip())
-    except json.JSONDecodeError as exc:
-        return {"ok": False, "err": f"json_parse: {exc}"}
+def send_frame(ser: FramedSerial, frame: bytes) -> dict:
+    """Write an already-encoded command frame and read its response."""
+    ser.write(frame)
+    return ser.recv_json()
 
 
-def ping_esp32(ser: serial.Serial) -> bool:
+def send_cmd(ser: FramedSerial, cmd: dict) -> dict:
+    return send_frame(ser, json_dumps(cmd) + b"\n")
+
+
+def ping_esp32(ser: FramedSerial) -> Optional[dict]:
+    """Ping until the ESP32 answers. Returns the pong (carrying its "caps"), or None."""
     for attempt in range(1, MAX_RETRIES + 1):
-        resp = send_cmd(ser, {"cmd": "ping"})
+        resp = send_frame(ser, PING_FRAME)
         if resp.get("ok") and resp.get("msg") == "pong":
-            return True
+            return resp
         log.warning(f"Ping {attempt}/{MAX_RETRIES} failed: {resp}")
         time.sleep(RETRY_DELAY)
-    return False
+    return None
+
+
+def connect(port: str, baud: int, fast_baud: int,
+            go: threading.Event, abort: threading.Event
+            ) -> tuple[Optional[FramedSerial], Optional[dict]]:
+    """
+    Open the port at `baud` and ping; returns (serial, pong or None).  Until
+    `go` is set only the wait for the device node runs — that overlaps the
+    plan load without touching the port — and if `abort` is set by then the
+    port is never opened: (None, None).
+    """
+    while not go.is_set() and not os.path.exists(port):
+        go.wait(POLL_INTERVAL)
+    go.wait()
+    if abort.is_set():
+        return None, None
+    ser = open_serial(port, baud, fast_baud)
+    log.info("Pinging ESP32…")
+    return ser, ping_esp32(ser)
+
+
+def switch_baud(ser: FramedSerial, caps: list, rate: int) -> None:
+    """
+    Move the link to `rate` if the firmware advertises the "baud" command.
+    The firmware replies at the old rate and then switches; a ping at the
+    new rate confirms it.  If that ping fails the firmware drops back to its
+    SERIAL_BAUD on its own after BAUD_CONFIRM, and the Pi to the rate it
+    was at.
+    """
+    base = ser.baudrate
+    if not rate or rate == base:
+        return
+    if "baud" not in caps:
+        log.info(f"Firmware cannot change baud — staying at {ser.baudrate}.")
+        return
+    resp = send_cmd(ser, {"cmd": "baud", "rate": rate})
+    if not resp.get("ok"):
+        log.warning(f"Baud switch to {rate} refused: {resp.get('err', 'unknown')}")
+        return
+    ser.baudrate = rate
+    if send_frame(ser, PING_FRAME).get("msg") == "pong":
+        log.info(f"Link running at {rate} baud ✓")
+        return
+    log.warning(f"No pong at {rate} baud — falling back to {base}.")
+    ser.baudrate = base
+    time.sleep(BAUD_CONFIRM)
+    ser.reset_input_buffer()
+
+
+# ---------------------------------------------------------------------------
+# Pipelined writer
+# ---------------------------------------------------------------------------
+
+class SerialPipeline:
+    """
+    Writes queued commands from a worker thread while the main thread drains
+    responses, so the Pi keeps encoding/sending while the ESP32 transmits IR.
+
+    Frames are pre-encoded and tagged with an "id" that the firmware echoes
+    back; the ESP32 handles commands in order, so a reply without an id
+    (e.g. a json_parse error) is matched by position instead.
+
+    At most `window` bytes are in flight (written but not yet answered) at
+    any time, so a long run of codes cannot overrun the firmware's RX buffer
+    while it is busy transmitting.
+    """
+
+    def __init__(self, ser: FramedSerial, window: int = RX_WINDOW):
+        self.ser = ser
+        self.window = window
+        self._tx: queue.Queue = queue.Queue()
+        self._pending: list[int] = []
+        self._sizes: dict[int, int] = {}
+        self._window = threading.Condition()
+        self._in_flight = 0
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _reserve(self, size: int, block: bool) -> bool:
+        """Admit `size` bytes to the in-flight window; a lone frame always fits."""
+        def fits() -> bool:
+            return self._in_flight == 0 or self._in_flight + size <= self.window
+        with self._window:
+            if block:
+                self._window.wait_for(fits)
+            elif not fits():
+                return False
+            self._in_flight += size
+            return True
+
+    def _release(self, size: int) -> None:
+        with self._window:
+            self._in_flight -= size
+            self._window.notify()
+
+    def _write_loop(self) -> None:
+        held = None          # frame dequeued but not yet admitted to the window
+        stopping = False
+        while not stopping:
+            frame = held if held is not None else self._tx.get()
+            held = None
+            if frame is None:                  # close() sentinel
+                return
+            self._reserve(len(frame), block=True)
+            batch = [frame]
+            # Coalesce whatever else is queued and still fits into one write
+            while not self._tx.empty():
+                nxt = self._tx.get_nowait()
+                if nxt is None:
+                    stopping = True
+                    break
+                if not self._reserve(len(nxt), block=False):
+                    held = nxt
+                    break
+                batch.append(nxt)
+            try:
+                self.ser.write(b"".join(batch))  # the only writer while the pipe is open
+            except serial.SerialTimeoutException as exc:
+                log.error(f"Serial write timed out: {exc}")
+
+    def submit(self, rid: int, frame: bytes) -> int:
+        """Queue an encoded frame carrying request id `rid`. Returns `rid`."""
+        self._pending.append(rid)
+        self._sizes[rid] = len(frame)
+        self._tx.put(frame)
+        return rid
+
+    def drain(self) -> dict[int, dict]:
+        """Read one response per submitted command. Returns {id: response}."""
+        results = {}
+        for expected in self._pending:
+            resp = self.ser.recv_json()
+            results[resp.pop("id", expected)] = resp
+            self._release(self._sizes.pop(expected))
+        self._pending = []
+        return results
+
+    def close(self) -> None:
+        self._tx.put(None)
+        self._writer.join()
 
 
 # ---------------------------------------------------------------------------
 # Config loader
 # ---------------------------------------------------------------------------
 
-def load_boot_config(path: str) -> dict:
-    if not os.path.exists(path):
+def load_boot_config(path: str) -> Iterable[tuple[str, dict]]:
+    """
+    Return the (name, entry) pairs of boot_config.json.  Small files are
+    parsed in one go; larger ones are streamed with ijson when it is
+    installed, so configs with many unused codes never sit in memory whole.
+    """
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
         log.error(f"boot_config.json not found at {path}. Run ir_recorder.py first.")
         sys.exit(1)
-    with open(path) as f:
+    if ijson is not None and os.fstat(f.fileno()).st_size >= STREAM_THRESHOLD:
+        return _stream_boot_config(f, path)
+    with f:
         try:
-            return json.load(f)
-        except json.JSONDecodeError as exc:
+            return json_loads(f.read()).items()
+        except ValueError as exc:
             log.error(f"Invalid JSON in {path}: {exc}")
             sys.exit(1)
 
 
+def _stream_boot_config(f, path: str) -> Iterable[tuple[str, dict]]:
+    with f:
+        try:
+            # use_float: numbers come back as float, not Decimal, like json_loads
+            yield from ijson.kvitems(f, "", use_float=True)
+        except ijson.JSONError as exc:
+            log.error(f"Invalid JSON in {path}: {exc}")
+            sys.exit(1)
+
+
+def frames_path(config_path: str) -> str:
+    return os.path.splitext(config_path)[0] + ".frames"
+
+
+def config_stamp(config_path: str) -> Optional[tuple[int, int]]:
+    """(st_mtime_ns, st_size) of boot_config.json, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(config_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_boot_frames(config_path: str, stamp: Optional[tuple[int, int]]) -> Optional[list]:
+    """
+    Return the cached boot plan (see build_plan) if boot_config.frames was
+    built from boot_config.json as it is now — its recorded config_stamp
+    must match exactly, so restoring an older config with its mtime kept
+    (cp -p, rsync -a) is not mistaken for a fresh one — otherwise None.
+    """
+    if stamp is None:
+        return None
+    try:
+        with open(frames_path(config_path), "rb") as f:
+            version, built_from, plan = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+    return plan if version == FRAMES_VERSION and tuple(built_from) == stamp else None
+
+
+def write_boot_frames(config_path: str, plan: list, stamp: Optional[tuple[int, int]]) -> None:
+    """Cache `plan`, built from the config whose config_stamp is `stamp`."""
+    if stamp is None:
+        return
+    # Synced temp file + os.replace: a power cut mid-write leaves the
+    # previous cache in place rather than a torn one
+    path = frames_path(config_path)
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump((FRAMES_VERSION, stamp, plan), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except OSError as exc:
+        with suppress(OSError):
+            os.unlink(tmp)
+        log.warning(f"Could not write {path}: {exc}")
+
+
 # ---------------------------------------------------------------------------
 # Code push + send
 # ---------------------------------------------------------------------------
 
-def push_code(ser: serial.Serial, name: str, entry: dict) -> bool:
+def build_push_cmd(name: str, entry: dict) -> Optional[dict]:
     """
-    Push a code into ESP32 RAM using define or define_raw.
-    Returns True on success.
+    Build the define / define_raw command that loads a code into ESP32 RAM.
+    Returns None if the boot_config entry is missing its signal data.
     """
     code_type = entry.get("type", "").upper()
 
@@ -118,37 +555,108 @@ def push_code(ser: serial.Serial, name: str, entry: dict) -> bool:
         freq = entry.get("freq", 38000)
         data = entry.get("data")
         if not data:
-            log.warning(f"  [{name}] No 'data' field in boot_config — skipping.")
-            return False
-        cmd = {"cmd": "define_raw", "name": name, "freq": freq, "data": data}
+            return None
+        return {"cmd": "define_raw", "name": name, "freq": freq, "data": data}
 
-    else:
-        # Decoded protocol (NEC, SONY, SAMSUNG, etc.)
-        value = entry.get("value")
-        bits  = entry.get("bits", 32)
-        if value is None:
-            log.warning(f"  [{name}] No 'value' field in boot_config — skipping.")
-            return False
-        cmd = {"cmd": "define", "name": name, "type": code_type,
-               "value": str(value), "bits": bits}
+    # Decoded protocol (NEC, SONY, SAMSUNG, etc.)
+    value = entry.get("value")
+    bits  = entry.get("bits", 32)
+    if value is None:
+        return None
+    return {"cmd": "define", "name": name, "type": code_type,
+            "value": str(value), "bits": bits}
 
-    resp = send_cmd(ser, cmd)
-    if resp.get("ok"):
+
+def pack_raw(data: list) -> str:
+    """
+    RAW timings as base64 of little-endian uint16s — the compact "data" form
+    the firmware accepts in place of a JSON array (cap "define_raw_b64").
+    Values are clamped to 0xFFFF exactly as the firmware clamps arrays.
+    """
+    return base64.b64encode(struct.pack(f"<{len(data)}H",
+                                        *(min(int(v), 0xFFFF) for v in data))).decode()
+
+
+def check_code(name: str, kind: str, resps: list[dict]) -> bool:
+    """
+    Log the outcome of one code.  `kind` is "split" (define + send replies),
+    "combined" (a single define_and_send reply) or "resident" (a send reply
+    for a code already in ESP32 RAM).  Returns True if the code was sent.
+    """
+    if kind == "split":
+        push_resp, fire_resp = resps
+        if not push_resp.get("ok"):
+            log.warning(f"  [{name}] define failed: {push_resp.get('err', 'unknown')}")
+            return False
         log.info(f"  [{name}] Loaded into ESP32 RAM ✓")
-        return True
     else:
-        log.warning(f"  [{name}] define failed: {resp.get('err', 'unknown')}")
+        fire_resp, = resps
+
+    if not fire_resp.get("ok"):
+        what = "define_and_send" if kind == "combined" else "Send"
+        log.warning(f"  [{name}] {what} failed: {fire_resp.get('err', 'unknown')}")
         return False
+    log.info(f"  [{name}] " + {"split": "Sent ✓",
+                               "combined": "Loaded and sent ✓",
+                               "resident": "Already in ESP32 RAM — sent ✓"}[kind])
+    return True
 
 
-def fire_code(ser: serial.Serial, name: str) -> bool:
-    resp = send_cmd(ser, {"cmd": "send", "name": name, "repeats": 0})
-    if resp.get("ok"):
-        log.info(f"  [{name}] Sent ✓")
-        return True
-    else:
-        log.warning(f"  [{name}] Send failed: {resp.get('err', 'unknown')}")
-        return False
+def code_key(code: dict) -> Optional[tuple]:
+    """
+    (type, value, bits) identifying a decoded code, from either a define
+    command or an entry of the firmware's list reply.  None for RAW codes,
+    whose timings the list reply does not carry.
+    """
+    t = code.get("type", "").upper()
+    if not t or t == "RAW":
+        return None
+    try:
+        return t, int(str(code.get("value")), 0), int(code.get("bits", 32))
+    except (TypeError, ValueError):
+        return None
+
+
+def encode_frame(cmd: dict, rid: int) -> bytes:
+    return json_dumps({**cmd, "id": rid}) + b"\n"
+
+
+def build_plan(entries: Iterable[tuple[str, dict]]) -> list:
+    """
+    The send_on_boot entries as (name, description, delay_ms, key, push,
+    fire, combined) tuples: key is the code_key, the rest pre-encoded
+    (id, frame) pairs.  key, push and combined are None without signal data.
+    """
+    plan = []
+    to_send = ((k, v) for k, v in entries if v.get("send_on_boot"))
+    for i, (name, entry) in enumerate(to_send):
+        push_cmd = build_push_cmd(name, entry)
+        key = push = combined = None
+        if push_cmd:
+            key = code_key(push_cmd)
+            both_cmd = {**push_cmd, "cmd": "define_and_send",
+                        "type": push_cmd.get("type", "RAW"), "repeats": 0}
+            if both_cmd["type"] == "RAW":
+                both_cmd["data"] = pack_raw(push_cmd["data"])
+            push = (2 * i + 1, encode_frame(push_cmd, 2 * i + 1))
+            combined = (2 * i + 1, encode_frame(both_cmd, 2 * i + 1))
+        fire = (2 * i + 2, encode_frame({"cmd": "send", "name": name, "repeats": 0}, 2 * i + 2))
+        plan.append((name, entry.get("description", ""),
+                     entry.get("delay_before_ms", 0), key, push, fire, combined))
+    return plan
+
+
+def collect(pipe: SerialPipeline, pending: list[tuple[str, str, tuple[int, ...]]]) -> int:
+    """
+    Drain responses for every queued (name, kind, request ids) entry; see
+    check_code for the kinds.  Returns the number of codes sent successfully.
+    """
+    if not pending:
+        return 0
+    results = pipe.drain()
+    missing = {"ok": False, "err": "no_response"}
+    return sum(check_code(name, kind, [results.get(rid, missing) for rid in ids])
+               for name, kind, ids in pending)
 
 
 # ---------------------------------------------------------------------------
@@ -156,54 +664,115 @@ def fire_code(ser: serial.Serial, name: str) -> bool:
 # ---------------------------------------------------------------------------
 
 def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[logging.StreamHandler(sys.stdout)],
+    )
     parser = argparse.ArgumentParser(description="TVWIZ IR Boot Sender")
     parser.add_argument("--port",   default=DEFAULT_PORT)
-    parser.add_argument("--baud",   type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--baud",   type=int, default=BASE_BAUD,
+                        help="rate to open the port at; must match the firmware's SERIAL_BAUD")
+    parser.add_argument("--fast-baud", type=int, default=FAST_BAUD,
+                        help="rate to switch to after the ping if the firmware supports it "
+                             "(0 = stay at --baud)")
     parser.add_argument("--config", default=BOOT_CONFIG_FILE)
     args = parser.parse_args()
 
     log.info("TVWIZ IR Boot Sender starting…")
     log.info(f"Config : {args.config}")
-    log.info(f"Port   : {args.port} @ {args.baud} baud")
-
-    # 1. Load config
-    config = load_boot_config(args.config)
-    to_send = {k: v for k, v in config.items() if v.get("send_on_boot")}
-
-    if not to_send:
+    log.info(f"Port   : {args.port} @ {args.baud} baud"
+             + (f" (then {args.fast_baud} if supported)" if args.fast_baud else ""))
+
+    # 1. Wait for the ESP32's USB device in a worker thread while this one
+    #    loads the boot plan — enumeration and disk I/O are independent.
+    #    The port is only opened (which may reset the ESP32) and pinged once
+    #    the plan has codes to send; an empty or unreadable config leaves
+    #    the serial link alone.  The plan is the pre-encoded frames when
+    #    the cache is fresh, otherwise boot_config.json (and the cache is
+    #    refreshed from it).
+    go, abort = threading.Event(), threading.Event()
+    plan = None
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        link = pool.submit(connect, args.port, args.baud, args.fast_baud, go, abort)
+        try:
+            stamp = config_stamp(args.config)  # before reading, so a later edit invalidates
+            plan = load_boot_frames(args.config, stamp)
+            if plan is None:
+                plan = build_plan(load_boot_config(args.config))
+                write_boot_frames(args.config, plan, stamp)
+            else:
+                log.info(f"Using pre-encoded frames from {frames_path(args.config)}")
+        finally:
+            if not plan:
+                abort.set()
+            go.set()
+        ser, pong = link.result()
+
+    if not plan:
         log.info("No codes marked 'send_on_boot': true — nothing to do.")
         sys.exit(0)
 
-    log.info(f"Will send: {list(to_send.keys())}")
-
-    # 2. Open serial
-    ser = open_serial(args.port, args.baud)
+    log.info(f"Will send: {[name for name, *_ in plan]}")
 
-    # 3. Ping
-    log.info("Pinging ESP32…")
-    if not ping_esp32(ser):
+    # 2. Check the ping
+    if pong is None:
         log.error("ESP32 not responding. Aborting.")
         ser.close()
         sys.exit(1)
     log.info("ESP32 connected ✓")
+    # The finally hands the link back at --baud even on an error or Ctrl-C
+    try:
+        switch_baud(ser, pong.get("caps", []), args.fast_baud)
+        # Firmware that advertises define_and_send (and base64 RAW data, which
+        # the combined frames carry) gets one command per code
+        caps = pong.get("caps", [])
+        use_combined = "define_and_send" in caps and "define_raw_b64" in caps
+        # Firmware from before caps has the core's ~256-byte RX buffer (and
+        # does not read Serial while transmitting IR)
+        window = RX_WINDOW if caps else LEGACY_RX_WINDOW
+
+        # Codes the ESP32 still holds from before (it was not reset) only need firing
+        resp = send_frame(ser, LIST_FRAME)
+        resident = {c.get("name"): code_key(c) for c in resp.get("codes", [])}
+
+        # 3. Push + send each code.  Commands are queued to the writer thread
+        #    while this thread drains responses; a delay first waits for every
+        #    queued code so it is measured from the previous code's transmission.
+        pipe = SerialPipeline(ser, window)
+        sent = failed = 0
+        pending: list[tuple[str, str, tuple[int, ...]]] = []
+        for name, desc, delay_ms, key, push, fire, combined in plan:
+            log.info(f"Processing: {name}" + (f" ({desc})" if desc else ""))
+
+            if delay_ms > 0:
+                ok = collect(pipe, pending)
+                sent += ok
+                failed += len(pending) - ok
+                pending = []
+
+                log.info(f"  Waiting {delay_ms} ms…")
+                time.sleep(delay_ms / 1000)
+
+            if push is None:
+                log.warning(f"  [{name}] No signal data ('value' / 'data') in boot_config — skipping.")
+                failed += 1
+                continue
+            known = resident.get(name)
+            if known is not None and known == key:
+                pending.append((name, "resident", (pipe.submit(*fire),)))
+            elif use_combined:
+                pending.append((name, "combined", (pipe.submit(*combined),)))
+            else:
+                pending.append((name, "split", (pipe.submit(*push), pipe.submit(*fire))))
+
+        ok = collect(pipe, pending)
+        sent += ok
+        failed += len(pending) - ok
+        pipe.close()
+    finally:
+        ser.close()
 
-    # 4. Push + send each code
-    sent = failed = 0
-    for name, entry in to_send.items():
-        desc = entry.get("description", "")
-        log.info(f"Processing: {name}" + (f" ({desc})" if desc else ""))
-
-        delay_ms = entry.get("delay_before_ms", 0)
-        if delay_ms > 0:
-            log.info(f"  Waiting {delay_ms} ms…")
-            time.sleep(delay_ms / 1000)
-
-        if push_code(ser, name, entry) and fire_code(ser, name):
-            sent += 1
-        else:
-            failed += 1
-
-    ser.close()
     log.info(f"Done — sent: {sent}, failed: {failed}")
     sys.exit(0 if failed == 0 else 1)
 
@@ -9,9 +9,10 @@ written to boot_config.json when you press 'w'.  boot_config.json is the
 single source of truth for ir_boot_sender.py.
 
 Usage:
-    python3 ir_recorder.py [--port /dev/ttyUSB0] [--baud 115200]
+    python3 ir_recorder.py [--port /dev/ttyUSB0] [--baud 115200] [--fast-baud 921600]
+                           [--legacy-json]
 
-Menu:
+Menu (single keypress on a terminal):
     l  — Learn a new IR code  (stores full payload in memory)
     t  — Test / send a code   (fires the code from ESP32 RAM)
     s  — Show codes in memory + ESP32 RAM status
@@ -26,145 +27,513 @@ import time
 import argparse
 import os
 import sys
-
-BOOT_CONFIG_FILE = os.path.join(os.path.dirname(__file__), "boot_config.json")
+import logging
+import queue
+import struct
+import threading
+from contextlib import contextmanager, suppress
+from itertools import count
+from typing import Optional
+
+# Same directory: the boot sender owns the boot_config.frames layout, the
+# JSON codec choice, the link rates and the latency-timer tweak
+from ir_boot_sender import (BASE_BAUD, FAST_BAUD, BAUD_CONFIRM, WRITE_TIMEOUT,
+                            build_plan, json_dumps, json_loads, set_low_latency,
+                            write_boot_frames)
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional — the link then stays on JSON lines
+    msgpack = None
+
+try:
+    import readline
+except ImportError:  # no GNU readline/libedit — name prompts work without completion
+    readline = None
+
+try:
+    import termios
+    import tty
+except ImportError:  # not a POSIX terminal (e.g. Windows) — menu falls back to input()
+    termios = None
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+BOOT_CONFIG_FILE = os.path.join(_HERE, "boot_config.json")
 DEFAULT_PORT = "/dev/ttyUSB0"
-DEFAULT_BAUD = 115200
 LEARN_TIMEOUT_MS = 15000
+CMD_DEADLINE_MS = 1000   # reply budget for ordinary commands (a RAW define at 115200 baud included)
+PING_DEADLINE_MS = 250
+ACK_DEADLINE_MS = 500    # learn_ready arrives within a few ms
+BOOT_TIMEOUT = 3.0       # seconds to wait for the ESP32 to report it is up
+POLL_INTERVAL_MS = 100
+MAX_FRAME = 4096 - 4     # largest MessagePack frame the firmware's RX buffer takes
+
+# Static commands, encoded once with fixed request ids; send_cmd numbers
+# everything else from FIRST_ID up
+PING_ID, LIST_ID, FIRST_ID = 1, 2, 3
+PING_CMD = {"cmd": "ping", "id": PING_ID}
+LIST_CMD = {"cmd": "list", "id": LIST_ID}
+PING_FRAME = json_dumps(PING_CMD) + b"\n"
+LIST_FRAME = json_dumps(LIST_CMD) + b"\n"
 
 
 # ---------------------------------------------------------------------------
 # Serial helpers
 # ---------------------------------------------------------------------------
 
-def open_serial(port: str, baud: int) -> serial.Serial:
+class FramedSerial(serial.Serial):
+    """
+    serial.Serial read in bulk by a daemon thread and decoded on a second
+    one, so the port keeps draining while the menu waits on the keyboard.
+    Replies are matched to the request in flight (see README, section 6).
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._rx = bytearray()
+        self._ids = count(FIRST_ID)
+        self._awaiting: Optional[int] = None
+        self._replies: queue.Queue = queue.Queue()
+        self._raw_q: queue.Queue = queue.Queue()   # (frame bytes, decoder), None = stop
+        self._reader: Optional[threading.Thread] = None
+        self._parser: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.echo = False   # print unsolicited lines (off during boot chatter)
+        self.boots = 0      # unsolicited boot banners seen, i.e. ESP32 resets
+        self.positional = False  # firmware does not echo ids; set by the parser
+        self.packed = False      # TX framing
+        self._rx_packed = False  # RX framing, owned by the parser thread
+        self.ping_frame, self.list_frame = PING_FRAME, LIST_FRAME
+        self.base_baud: Optional[int] = None
+        super().__init__(*args, **kwargs)
+        self.base_baud = self.baudrate  # the firmware's SERIAL_BAUD; restored on close
+
+    def encode(self, cmd: dict) -> bytes:
+        """One command in the link's current framing."""
+        if self.packed:
+            buf = msgpack.packb(cmd)
+            return struct.pack("<I", len(buf)) + buf
+        return json_dumps(cmd) + b"\n"
+
+    def use_packed(self) -> None:
+        self.packed = True
+        self.ping_frame, self.list_frame = self.encode(PING_CMD), self.encode(LIST_CMD)
+
+    def use_json(self) -> None:
+        self.packed = self._rx_packed = False
+        self.ping_frame, self.list_frame = PING_FRAME, LIST_FRAME
+
+    def start_reader(self) -> None:
+        self._parser = threading.Thread(target=self._parse_loop, daemon=True)
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._parser.start()
+        self._reader.start()
+
+    def _read_loop(self) -> None:
+        try:
+            self._split_frames()
+        finally:
+            self._raw_q.put(None)
+
+    def _split_frames(self) -> None:
+        while not self._stop.is_set():
+            try:
+                chunk = self.read(max(1, self.in_waiting))
+            except (serial.SerialException, OSError):
+                return  # port closed under us
+            self._rx += chunk
+            while True:
+                if self._rx_packed:
+                    if len(self._rx) < 4:
+                        break
+                    n, = struct.unpack_from("<I", self._rx)
+                    if n > MAX_FRAME or self._rx.startswith(b'{"'):
+                        self.use_json()  # not a frame: the firmware is on JSON again
+                        continue
+                    if len(self._rx) < 4 + n:
+                        break
+                    raw = bytes(self._rx[4:4 + n])
+                    del self._rx[:4 + n]
+                    self._raw_q.put((raw, msgpack.unpackb))
+                else:
+                    nl = self._rx.find(b"\n")
+                    if nl < 0:
+                        break
+                    raw = bytes(self._rx[:nl + 1])
+                    del self._rx[:nl + 1]
+                    self._raw_q.put((raw, json_loads))
+
+    def _parse_loop(self) -> None:
+        while True:
+            item = self._raw_q.get()
+            if item is None:
+                return
+            self._route(*item)
+
+    def _route(self, raw: bytes, loads) -> None:
+        try:
+            resp = loads(raw)
+        except ValueError:
+            resp = None
+        if isinstance(resp, dict) and self._awaiting is not None:
+            rid = resp.get("id")
+            if rid is None and resp.get("msg") == "pong":
+                self.positional = True
+            # A command the firmware could not parse comes back without an id
+            if rid == self._awaiting or (rid is None and (
+                    "err" in resp or self.positional and resp.get("msg") != "boot")):
+                resp.pop("id", None)
+                if resp.get("ok") and resp.get("msg") in ("msgpack", "json"):
+                    self._rx_packed = resp["msg"] == "msgpack"  # framing reply
+                self._replies.put(resp)
+                return
+        if isinstance(resp, dict) and resp.get("msg") == "boot":
+            self.boots += 1
+        text = str(resp) if self._rx_packed else raw.decode(errors="replace").strip()
+        if text and self.echo:
+            print(f"\n  [ESP32] {text}")
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def expect(self, rid: int) -> None:
+        """Mark `rid` as the request in flight; older replies are dropped."""
+        self._awaiting = rid
+        while not self._replies.empty():
+            self._replies.get_nowait()
+
+    def recv_json(self, deadline_ms: int) -> dict:
+        """Next reply to the request in flight, waiting at most `deadline_ms`."""
+        try:
+            return self._replies.get(timeout=deadline_ms / 1000)
+        except queue.Empty:
+            return {"ok": False, "err": "no_response"}
+
+    def reset_input_buffer(self) -> None:
+        super().reset_input_buffer()
+        while not self._replies.empty():
+            self._replies.get_nowait()
+
+    def close(self) -> None:
+        reader, self._reader = self._reader, None
+        if reader is not None:
+            self.echo = False
+            with suppress(serial.SerialException):
+                restore_link(self)
+            self._stop.set()
+            self.cancel_read()  # wake the reader if it is blocked in read()
+            reader.join()
+            self._parser.join()  # the reader's exit queued its stop marker
+        super().close()
+
+
+def wait_ready(s: FramedSerial) -> dict:
+    """
+    Ping every POLL_INTERVAL_MS until the firmware answers instead of sleeping
+    a fixed time (opening the port may reset the ESP32), then swallow
+    the pongs to any extra pings.  ROM bootloader chatter and the boot
+    banner are not echoed.  Returns the first pong, or {} after BOOT_TIMEOUT.
+    """
+    s.expect(PING_ID)
+    pong: dict = {}
+    deadline = time.monotonic() + BOOT_TIMEOUT
+    while not pong and time.monotonic() < deadline:
+        s.write(PING_FRAME)
+        resp = s.recv_json(POLL_INTERVAL_MS)
+        if resp.get("ok") and resp.get("msg") == "pong":
+            pong = resp
+    while s.recv_json(POLL_INTERVAL_MS).get("ok"):
+        pass
+    s.echo = True
+    return pong
+
+
+def open_serial(port: str, baud: int) -> FramedSerial:
     try:
-        s = serial.Serial(port, baud, timeout=10)
-        time.sleep(1.5)          # let ESP32 finish boot/reset
-        s.reset_input_buffer()   # discard the boot "ok"/"boot" message
-        return s
+        # timeout=None: the reader thread blocks in read() until data
+        # arrives; close() wakes it with cancel_read()
+        s = FramedSerial(port, baud, timeout=None, write_timeout=WRITE_TIMEOUT,
+                         exclusive=True)  # fail fast if the boot sender holds it
     except serial.SerialException as exc:
         print(f"[ERROR] Cannot open {port}: {exc}")
         sys.exit(1)
+    set_low_latency(s)
+    s.start_reader()
+    return s
+
+
+def _exchange(ser: FramedSerial, frame: bytes, rid: int, deadline_ms: int) -> dict:
+    ser.expect(rid)
+    ser.write(frame)
+    return ser.recv_json(deadline_ms)
+
+
+def send_frame(ser: FramedSerial, frame: bytes, rid: int,
+               deadline_ms: int = CMD_DEADLINE_MS) -> dict:
+    """Write an already-encoded command frame tagged `rid` and read its first reply."""
+    resp = _exchange(ser, frame, rid, deadline_ms)
+    if resp.get("err") == "no_response" and (ser.baudrate != ser.base_baud or ser.packed):
+        resync(ser)
+    return resp
 
 
-def send_cmd(ser: serial.Serial, cmd: dict) -> dict:
+def send_cmd(ser: FramedSerial, cmd: dict, deadline_ms: int = CMD_DEADLINE_MS) -> dict:
     """Send a JSON command and read the first response line."""
-    ser.write((json.dumps(cmd) + "\n").encode())
-    raw = ser.readline()
-    if not raw:
-        return {"ok": False, "err": "no_response"}
-    try:
-        return json.loads(raw.decode().strip())
-    except json.JSONDecodeError as exc:
-        return {"ok": False, "err": f"json_parse: {exc}"}
+    rid = ser.next_id()
+    return send_frame(ser, ser.encode({**cmd, "id": rid}), rid, deadline_ms)
+
+
+def named_cmd(cmd: str, **fixed):
+    """
+    Frame builder for {"cmd": cmd, "name": <name>, **fixed, "id": <rid>}.
+    On a JSON link the constant parts are encoded here, once, and each call
+    only encodes the name (json_dumps, so it is escaped properly) and the id.
+    """
+    head = json_dumps({"cmd": cmd})[:-1] + b',"name":'
+    tail = (b"," + json_dumps(fixed)[1:-1] if fixed else b"") + b',"id":'
+
+    def frame(ser: FramedSerial, name: str, rid: int) -> bytes:
+        if ser.packed:
+            return ser.encode({"cmd": cmd, "name": name, **fixed, "id": rid})
+        return b"%s%s%s%d}\n" % (head, json_dumps(name), tail, rid)
+    return frame
+
+
+build_send_frame = named_cmd("send", repeats=0)
+build_erase_frame = named_cmd("erase")
+build_learn_frame = named_cmd("learn", timeout_ms=LEARN_TIMEOUT_MS)
+
+
+def send_named(ser: FramedSerial, build, name: str,
+               deadline_ms: int = CMD_DEADLINE_MS) -> dict:
+    """send_cmd for the commands that only vary by name (see named_cmd)."""
+    rid = ser.next_id()
+    return send_frame(ser, build(ser, name, rid), rid, deadline_ms)
+
+
+def build_push_cmd(name: str, payload: dict) -> dict:
+    """define / define_raw command that loads a cached payload into ESP32 RAM."""
+    t = payload.get("type", "").upper()
+    if t == "RAW":
+        return {"cmd": "define_raw", "name": name,
+                "freq": payload.get("freq", 38000),
+                "data": payload["data"]}
+    return {"cmd": "define", "name": name, "type": t,
+            "value": str(payload.get("value", "0x0")),
+            "bits": payload.get("bits", 32)}
+
+
+def _ok(resp: dict, what: str = "") -> bool:
+    """True if `resp` succeeded; otherwise prints its error and returns False."""
+    if resp.get("ok"):
+        return True
+    print(f"  [ERROR] {what}{resp.get('err', 'unknown')}")
+    return False
+
+
+def ping(ser: FramedSerial) -> dict:
+    """Returns the pong (carrying the firmware's "caps"), or {} on failure."""
+    resp = _exchange(ser, ser.ping_frame, PING_ID, PING_DEADLINE_MS)
+    return resp if resp.get("ok") and resp.get("msg") == "pong" else {}
 
 
-def ping(ser: serial.Serial) -> bool:
-    resp = send_cmd(ser, {"cmd": "ping"})
-    return resp.get("ok") and resp.get("msg") == "pong"
+def switch_baud(ser: FramedSerial, caps: list, rate: int) -> None:
+    """
+    Move the link to `rate` if the firmware advertises the "baud" command.
+    If the confirming ping fails, the firmware reverts to its SERIAL_BAUD
+    after BAUD_CONFIRM and the Pi to the rate it was at.
+    """
+    base = ser.baudrate
+    if not rate or rate == base or "baud" not in caps:
+        return
+    resp = send_cmd(ser, {"cmd": "baud", "rate": rate})
+    if not resp.get("ok"):
+        print(f"  [WARN] Baud switch refused: {resp.get('err', 'unknown')}")
+        return
+    ser.baudrate = rate
+    if ping(ser):
+        return
+    print(f"  [WARN] No pong at {rate} baud — staying at {base}.")
+    ser.baudrate = base
+    time.sleep(BAUD_CONFIRM)
+    ser.reset_input_buffer()
+
+
+def switch_framing(ser: FramedSerial, caps: list) -> None:
+    """
+    Move the link to MessagePack frames when the firmware advertises it and
+    the msgpack package is installed: fewer bytes per reply and no text
+    parsing on either end.  The firmware answers in JSON, then switches.
+    """
+    if msgpack is None or "msgpack" not in caps:
+        return
+    resp = send_cmd(ser, {"cmd": "framing", "mode": "msgpack"})
+    if not resp.get("ok"):
+        print(f"  [WARN] MessagePack framing refused: {resp.get('err', 'unknown')}")
+        return
+    ser.use_packed()
+
+
+def resync(ser: FramedSerial) -> None:
+    """
+    A command went unanswered on a switched link.  If the ESP32 still answers
+    a ping the reply was only late; otherwise look for it where a reset puts
+    it, at the base rate on JSON lines, and stay there.
+    """
+    if _exchange(ser, ser.ping_frame, PING_ID, PING_DEADLINE_MS).get("msg") == "pong":
+        return
+    ser.baudrate = ser.base_baud
+    ser.use_json()
+    ser.write(b"\n")                 # end whatever the firmware made of the probe,
+    ser.recv_json(POLL_INTERVAL_MS)  # and take its json_parse reply
+    if _exchange(ser, ser.ping_frame, PING_ID, PING_DEADLINE_MS).get("msg") == "pong":
+        ser.boots += 1
+        print(f"\n  [WARN] ESP32 was reset — link back on JSON at {ser.base_baud} baud "
+              "(restart the recorder to switch again).")
+    else:
+        print("\n  [WARN] ESP32 not answering.")
+
+
+def restore_link(ser: FramedSerial) -> None:
+    """
+    Put the firmware back on JSON lines at the rate the port was opened at
+    before closing: it keeps a switched framing and rate until it is reset,
+    and the next program to open the port (the boot sender, say) speaks
+    only JSON and starts at --baud.
+    """
+    def request(cmd: dict) -> bool:
+        rid = ser.next_id()
+        return _exchange(ser, ser.encode({**cmd, "id": rid}), rid, PING_DEADLINE_MS).get("ok")
+
+    if ser.packed and request({"cmd": "framing", "mode": "json"}):
+        ser.use_json()
+    if ser.baudrate != ser.base_baud and request({"cmd": "baud", "rate": ser.base_baud}):
+        ser.baudrate = ser.base_baud
 
 
 # ---------------------------------------------------------------------------
 # Commands
 # ---------------------------------------------------------------------------
 
-def learn_code(ser: serial.Serial, cache: dict) -> None:
+def learn_code(ser: FramedSerial, cache: dict) -> None:
     name = input("  Descriptor for this code (e.g. tv1_power): ").strip()
     if not name:
         print("  [!] Name cannot be empty.")
         return
 
     print(f"  Sending learn… point remote at IR receiver now.")
-    ack = send_cmd(ser, {"cmd": "learn", "name": name, "timeout_ms": LEARN_TIMEOUT_MS})
-    if not ack.get("ok"):
-        print(f"  [ERROR] {ack.get('err', 'unknown')}")
+    ack = send_named(ser, build_learn_frame, name, ACK_DEADLINE_MS)
+    if not _ok(ack):
         return
     if ack.get("msg") == "learn_ready":
         print(f"  ESP32 ready — {LEARN_TIMEOUT_MS // 1000}s to press the button…")
 
-    # Second response: the captured payload (or an error)
-    raw = ser.readline()
-    if not raw:
+    # Second response: the captured payload (or an error).  The firmware
+    # only replies once its own learn window has elapsed, so wait past it.
+    result = ser.recv_json(LEARN_TIMEOUT_MS + 2000)
+    if result.get("err") == "no_response":
         print("  [ERROR] Timed out waiting for capture result.")
         return
-    try:
-        result = json.loads(raw.decode().strip())
-    except json.JSONDecodeError:
-        print("  [ERROR] Malformed response from ESP32.")
-        return
 
-    if not result.get("ok"):
-        print(f"  [ERROR] {result.get('err', 'unknown')}")
+    if not _ok(result):
         return
 
-    # Store the full payload in memory
+    # Store the full payload in memory (the firmware keeps it in RAM too)
     cache[name] = result
+    esp_names.add(name)
+    forget_esp_codes()
     print(f"  ✓ Captured and cached: {result}")
     print("  Press 'w' to write boot_config.json when ready.")
 
 
-def test_code(ser: serial.Serial, cache: dict) -> None:
+def test_code(ser: FramedSerial, cache: dict) -> None:
     if not cache:
         print("  (no codes in memory — learn something first)")
         return
     print("  Codes in memory: " + ", ".join(cache.keys()))
-    name = input("  Code name to send: ").strip()
+    name = ask_name("  Code name to send: ", cache)
     if name not in cache:
         print(f"  [!] '{name}' not in local cache. Learn it first with 'l'.")
         return
 
-    payload = cache[name]
-    t = payload.get("type", "").upper()
-
     # Push code into ESP32 RAM first (works even after an ESP32 reboot)
-    if t == "RAW":
-        push_cmd = {"cmd": "define_raw", "name": name,
-                    "freq": payload.get("freq", 38000),
-                    "data": payload["data"]}
-    else:
-        push_cmd = {"cmd": "define", "name": name, "type": t,
-                    "value": str(payload.get("value", "0x0")),
-                    "bits": payload.get("bits", 32)}
-
-    push_resp = send_cmd(ser, push_cmd)
-    if not push_resp.get("ok"):
-        print(f"  [ERROR] Could not push '{name}' to ESP32: {push_resp.get('err')}")
+    push_resp = send_cmd(ser, build_push_cmd(name, cache[name]))
+    if not _ok(push_resp, f"Could not push '{name}' to ESP32: "):
         return
 
-    resp = send_cmd(ser, {"cmd": "send", "name": name, "repeats": 0})
-    if resp.get("ok"):
+    esp_names.add(name)
+    forget_esp_codes()
+
+    resp = send_named(ser, build_send_frame, name)
+    if _ok(resp):
         print(f"  ✓ Sent '{name}'.")
-    else:
-        print(f"  [ERROR] {resp.get('err', 'unknown')}")
 
 
-def show_codes(ser: serial.Serial, cache: dict) -> None:
+# Names in ESP32 RAM as of the last list reply, kept current by the
+# commands that change it; feeds tab completion of name prompts
+esp_names: set[str] = set()
+
+# (ser.boots, codes) from the last list reply; None once a command may have
+# changed what the ESP32 holds.  A reset since then also makes it stale.
+_esp_codes: Optional[tuple[int, list]] = None
+
+
+def forget_esp_codes() -> None:
+    global _esp_codes
+    _esp_codes = None
+
+
+def list_esp_codes(ser: FramedSerial, force: bool = False) -> Optional[list]:
+    """
+    The firmware's codes in RAM as {"name", "type"} dicts (None if it did not
+    answer).  The reply also carries freq/len/value for the boot sender's
+    staleness check; nothing here reads them, so they are dropped with it.
+    Served from the last reply unless something invalidated it.
+    """
+    global _esp_codes
+    if not force and _esp_codes is not None and _esp_codes[0] == ser.boots:
+        return _esp_codes[1]
+    resp = send_frame(ser, ser.list_frame, LIST_ID)
+    if not resp.get("ok"):
+        return None
+    codes = [{"name": c["name"], "type": c.get("type", "UNKNOWN")}
+             for c in resp.get("codes", [])]
+    del resp
+    esp_names.clear()
+    esp_names.update(c["name"] for c in codes)
+    _esp_codes = (ser.boots, codes)
+    return codes
+
+
+def show_codes(ser: FramedSerial, cache: dict) -> None:
     if not cache:
-        print("  (no codes in memory)")
+        lines = ["  (no codes in memory)"]
     else:
-        print(f"  {'Name':<30} {'Type':<12} {'Details'}")
-        print(f"  {'-'*30} {'-'*12} {'-'*20}")
+        lines = [f"  {'Name':<30} {'Type':<12} {'Details'}",
+                 f"  {'-'*30} {'-'*12} {'-'*20}"]
         for name, payload in cache.items():
             t = payload.get("type", "?")
             if t == "RAW":
                 detail = f"freq={payload.get('freq',38000)} Hz, {len(payload.get('data',[]))} samples"
             else:
                 detail = f"value={payload.get('value','?')} bits={payload.get('bits','?')}"
-            print(f"  {name:<30} {t:<12} {detail}")
+            lines.append(f"  {name:<30} {t:<12} {detail}")
 
     # Also show what's currently in ESP32 RAM
-    resp = send_cmd(ser, {"cmd": "list"})
-    if resp.get("ok"):
-        esp_codes = resp.get("codes", [])
-        print(f"\n  ESP32 RAM ({len(esp_codes)} code(s)): " +
-              (", ".join(c["name"] for c in esp_codes) if esp_codes else "(empty)"))
+    esp_codes = list_esp_codes(ser)
+    if esp_codes is not None:
+        lines.append(f"\n  ESP32 RAM ({len(esp_codes)} code(s)): " +
+                     (", ".join(c["name"] for c in esp_codes) if esp_codes else "(empty)"))
+
+    # One write for the whole table rather than a print per row
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def erase_code(ser: serial.Serial, cache: dict) -> None:
-    name = input("  Code name to erase: ").strip()
+def erase_code(ser: FramedSerial, cache: dict) -> None:
+    name = ask_name("  Code name to erase: ", esp_names.union(cache))
     removed_local = cache.pop(name, None)
-    resp = send_cmd(ser, {"cmd": "erase", "name": name})
+    resp = send_named(ser, build_erase_frame, name)
+    esp_names.discard(name)
+    forget_esp_codes()
     if resp.get("ok") or removed_local:
         lines = []
         if removed_local:
@@ -176,29 +545,72 @@ def erase_code(ser: serial.Serial, cache: dict) -> None:
         print(f"  [ERROR] {resp.get('err', 'not_found')}")
 
 
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Replace `path` with `data` via a synced temp file and os.replace, so a
+    power cut mid-write leaves the old file rather than a truncated one.
+    """
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with suppress(OSError):
+            os.unlink(tmp)
+        raise
+
+
+# path → (mtime_ns, file bytes, parsed config); saves re-reading
+# boot_config.json on every 'w' when nobody else has touched it
+_cfg_cache: dict[str, tuple[int, bytes, dict]] = {}
+
+
+def load_existing_config(path: str) -> tuple[bytes, dict]:
+    """
+    Raw bytes and parsed contents of `path`: (b"", {}) if it is missing,
+    and an empty dict if it is not valid JSON.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return b"", {}
+    cached = _cfg_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1], cached[2]
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return b"", {}
+    try:
+        existing = json_loads(raw)
+    except ValueError:
+        existing = {}
+    _cfg_cache[path] = (mtime, raw, existing)
+    return raw, existing
+
+
 def save_codes(cache: dict) -> None:
     if not cache:
         print("  (no codes in memory to save — learn some first)")
         return
 
     # Load existing config to preserve send_on_boot / description edits
-    existing = {}
-    if os.path.exists(BOOT_CONFIG_FILE):
-        with open(BOOT_CONFIG_FILE) as f:
-            try:
-                existing = json.load(f)
-            except json.JSONDecodeError:
-                pass
+    old_raw, existing = load_existing_config(BOOT_CONFIG_FILE)
 
     boot_cfg = {}
     for name, payload in cache.items():
         t = payload.get("type", "UNKNOWN")
+        # Preserve user edits if the code already existed
+        prev = existing.get(name) or {}
         entry = {
             "type": t,
-            # Preserve user edits if the code already existed
-            "send_on_boot": existing.get(name, {}).get("send_on_boot", False),
-            "description":  existing.get(name, {}).get("description", ""),
-            "delay_before_ms": existing.get(name, {}).get("delay_before_ms", 0),
+            "send_on_boot": prev.get("send_on_boot", False),
+            "description":  prev.get("description", ""),
+            "delay_before_ms": prev.get("delay_before_ms", 0),
         }
         if t == "RAW":
             entry["freq"] = payload.get("freq", 38000)
@@ -209,8 +621,23 @@ def save_codes(cache: dict) -> None:
 
         boot_cfg[name] = entry
 
-    with open(BOOT_CONFIG_FILE, "w") as f:
-        json.dump(boot_cfg, f, indent=2)
+    # Compare what would be written byte for byte, so an unchanged save
+    # never touches the SD card (a hand-reformatted file still gets rewritten)
+    new_raw = json.dumps(boot_cfg, indent=2).encode()
+    if new_raw == old_raw:
+        print("  (no changes)")
+        return
+
+    try:
+        write_atomic(BOOT_CONFIG_FILE, new_raw)
+    except OSError as exc:
+        print(f"  [ERROR] Could not write {BOOT_CONFIG_FILE}: {exc}")
+        return
+    st = os.stat(BOOT_CONFIG_FILE)
+    _cfg_cache[BOOT_CONFIG_FILE] = (st.st_mtime_ns, new_raw, boot_cfg)
+    # Pre-encode the boot plan so ir_boot_sender.py skips the JSON work at boot
+    write_boot_frames(BOOT_CONFIG_FILE, build_plan(boot_cfg.items()),
+                      (st.st_mtime_ns, st.st_size))
 
     print(f"  ✓ Saved {len(boot_cfg)} code(s) to {BOOT_CONFIG_FILE}")
     print("  Set 'send_on_boot': true for codes you want fired at Pi startup.")
@@ -220,50 +647,128 @@ def save_codes(cache: dict) -> None:
 # Main
 # ---------------------------------------------------------------------------
 
+MENU = """
+  l  — Learn a new IR code
+  t  — Test / send a code
+  s  — Show codes
+  e  — Erase a code
+  w  — Write boot_config.json
+  q  — Quit
+"""
+
+@contextmanager
+def cbreak(fd: int):
+    """Put the terminal in cbreak mode (keys arrive without Enter) for the block."""
+    saved = termios.tcgetattr(fd)
+    try:
+        tty.setcbreak(fd)
+        yield
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, saved)
+
+
+def read_key(prompt: str) -> str:
+    """One menu keypress; a whole line when stdin is not a POSIX terminal."""
+    if termios is None or not sys.stdin.isatty():
+        return input(prompt).strip().lower()
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    with cbreak(sys.stdin.fileno()):
+        key = sys.stdin.read(1)
+    print(key.strip())  # cbreak turns off echo
+    return key.lower()
+
+
+def ask_name(prompt: str, names) -> str:
+    """input() for a code name, with tab completion over `names` when readline is available."""
+    if readline is None:
+        return input(prompt).strip()
+    options = sorted(names)
+    readline.set_completer(
+        lambda text, state: ([n for n in options if n.startswith(text)] + [None])[state])
+    try:
+        return input(prompt).strip()
+    finally:
+        readline.set_completer(None)
+
+
+# Menu key → handler(ser, cache); "q" is handled by the loop itself
+HANDLERS = {
+    "l": learn_code,
+    "t": test_code,
+    "s": show_codes,
+    "e": erase_code,
+    "w": lambda ser, cache: save_codes(cache),
+}
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="TVWIZ IR Recorder")
     parser.add_argument("--port", default=DEFAULT_PORT)
-    parser.add_argument("--baud", type=int, default=DEFAULT_BAUD)
+    parser.add_argument("--baud", type=int, default=BASE_BAUD,
+                        help="rate to open the port at; must match the firmware's SERIAL_BAUD")
+    parser.add_argument("--fast-baud", type=int, default=FAST_BAUD,
+                        help="rate to switch to after the ping if the firmware supports it "
+                             "(0 = stay at --baud)")
+    parser.add_argument("--legacy-json", action="store_true",
+                        help="stay on newline-delimited JSON even if the firmware "
+                             "supports MessagePack framing")
     args = parser.parse_args()
+    # Warnings from the helpers shared with ir_boot_sender, in this script's style
+    logging.basicConfig(level=logging.WARNING, format="[WARN] %(message)s",
+                        stream=sys.stdout)
 
     print("=" * 52)
     print("  TVWIZ IR Recorder")
-    print(f"  Port: {args.port}   Baud: {args.baud}")
+    print(f"  Port: {args.port}   Baud: {args.baud}"
+          + (f" → {args.fast_baud}" if args.fast_baud else ""))
     print("=" * 52)
 
     ser = open_serial(args.port, args.baud)
 
-    print("  Pinging ESP32…", end=" ", flush=True)
-    if ping(ser):
-        print("OK ✓")
-    else:
-        print("FAILED — check USB connection and try again.")
+    # Closing puts the firmware back on JSON at --baud; the finally covers
+    # Ctrl-C and errors as well as 'q'
+    try:
+        # wait_ready's pong doubles as the connectivity check — no second ping.
+        # A board the open did not reset may still be at the fast rate if an
+        # earlier run was killed before restoring it.
+        print("  Pinging ESP32…", end=" ", flush=True)
+        pong = wait_ready(ser)
+        if not pong and args.fast_baud and args.fast_baud != ser.baudrate:
+            ser.baudrate = args.fast_baud
+            pong = wait_ready(ser)
+            if not pong:
+                ser.baudrate = ser.base_baud
+        if pong:
+            print("OK ✓")
+        else:
+            print("FAILED — check USB connection and try again.")
+            sys.exit(1)
+        switch_baud(ser, pong.get("caps", []), args.fast_baud)
+        if not args.legacy_json:
+            switch_framing(ser, pong.get("caps", []))
+
+        # In-memory cache: name → full ESP32 JSON payload
+        cache: dict = {}
+
+        if readline is not None:
+            readline.parse_and_bind("tab: complete")
+        list_esp_codes(ser)  # seed name completion with what the ESP32 already holds
+
+        # The menu is shown once, and again only after an unknown key
+        sys.stdout.write(MENU)
+        while True:
+            choice = read_key("  > ")
+            handler = HANDLERS.get(choice)
+            if handler:
+                handler(ser, cache)
+            elif choice == "q":
+                break
+            else:
+                print("  Unknown command.")
+                sys.stdout.write(MENU)
+    finally:
         ser.close()
-        sys.exit(1)
-
-    # In-memory cache: name → full ESP32 JSON payload
-    cache: dict = {}
-
-    MENU = """
-  l  — Learn a new IR code
-  t  — Test / send a code
-  s  — Show codes
-  e  — Erase a code
-  w  — Write boot_config.json
-  q  — Quit"""
-
-    while True:
-        print(MENU)
-        choice = input("  > ").strip().lower()
-        if   choice == "l": learn_code(ser, cache)
-        elif choice == "t": test_code(ser, cache)
-        elif choice == "s": show_codes(ser, cache)
-        elif choice == "e": erase_code(ser, cache)
-        elif choice == "w": save_codes(cache)
-        elif choice == "q": break
-        else: print("  Unknown command.")
-
-    ser.close()
     print("  Bye!")
 
 